@@ -0,0 +1,109 @@
+"""Per-tick state deltas of a game.
+
+DeltaTracker turns the changes a SnakeGame records each tick into small
+deltas. The spectator feed sends them to viewers and the observation encoder
+applies them to its feature planes.
+"""
+from snake import Food
+
+
+def food_type_keys(game):
+    """Map each FoodType instance of a game to its key in game.food_types"""
+    return {id(food_type): key for key, food_type in game.food_types.items()}
+
+
+def take_scalars(game):
+    """Capture the small fields of the game state that are compared each tick"""
+    return {
+        'mode': game.game_mode.name,
+        'score': game.score,
+        'time_left': game.time_left,
+        'game_over': game.game_over,
+        'obstacles': tuple(game.obstacles),
+        'portals': tuple((portal.entrance, portal.exit, portal.is_active, portal.teleporting)
+                         for portal in game.portals),
+        'active_power_ups': tuple(sorted((power_up_type.name, expires_at - game.timers.now)
+                                         for power_up_type, expires_at in game.active_power_ups.items())),
+    }
+
+
+def take_snapshot(game, food_keys):
+    """Capture the parts of the game state that spectators need to see"""
+    snapshot = take_scalars(game)
+    snapshot['snake'] = tuple(game.snake)
+    snapshot['foods'] = frozenset((food.position, food_keys[id(food.type)]) for food in game.foods)
+    snapshot['power_ups'] = frozenset((power_up.position, power_up.type.name) for power_up in game.power_ups)
+    snapshot['arena_snakes'] = [(snake.number, snake.color, tuple(snake.body)) for snake in game.arena_alive]
+    snapshot['arena_foods'] = [(cell, food_keys[id(food_type)]) for cell, food_type in game.arena_foods.items()]
+    return snapshot
+
+
+class DeltaTracker:
+    """Builds per-tick deltas of a game from the changes it records.
+
+    The snake is sent as pushed head segments plus its new length, foods and
+    power-ups as added/removed entries, all taken from game.tick_changes.
+    Only the scalar fields are compared with the previous tick and sent whole
+    when they change. Arena snakes are sent as their new heads and lengths
+    plus the numbers of snakes that died, and arena foods as added/removed
+    cells, found by comparing with the previous tick. The first delta, and
+    any after a reset or a missed tick, is a full snapshot instead.
+    """
+
+    def __init__(self, game):
+        self.food_keys = food_type_keys(game)
+        self.scalars = None
+        self.tick = None
+        self.arena_heads = {}  # Arena snake number -> head cell
+        self.arena_foods = {}
+
+    def delta(self, game):
+        """Return what changed in game since the previous call"""
+        changes = game.tick_changes
+        scalars = take_scalars(game)
+        # A game reset since the last tick is only in game.changes so far
+        if (self.scalars is None or changes.reset or game.changes.reset or
+                game.tick != self.tick + 1):
+            delta = take_snapshot(game, self.food_keys)
+        else:
+            delta = {key: value for key, value in scalars.items() if value != self.scalars[key]}
+            if changes.snake_pushed or changes.snake_popped:
+                delta['snake_push'] = changes.snake_pushed[::-1]
+                delta['snake_len'] = len(game.snake)
+            self._add_items(delta, 'foods', changes.foods_added, changes.foods_removed)
+            self._add_items(delta, 'power_ups', changes.power_ups_added, changes.power_ups_removed)
+            self._add_arena(delta, game)
+        self.scalars = scalars
+        self.tick = game.tick
+        self.arena_heads = {snake.number: snake.body[0] for snake in game.arena_alive}
+        self.arena_foods = dict(game.arena_foods)
+        return delta
+
+    def _add_arena(self, delta, game):
+        moves = [(snake.number, snake.body[0], len(snake.body)) for snake in game.arena_alive
+                 if self.arena_heads.get(snake.number) != snake.body[0]]
+        if moves or len(game.arena_alive) != len(self.arena_heads):
+            alive = {snake.number for snake in game.arena_alive}
+            delta['arena_moves'] = moves
+            delta['arena_dead'] = [number for number in self.arena_heads if number not in alive]
+
+        foods = game.arena_foods
+        previous = self.arena_foods
+        added = [(cell, self.food_keys[id(food_type)]) for cell, food_type in foods.items()
+                 if previous.get(cell) is not food_type]
+        removed = [cell for cell in previous if cell not in foods]
+        if added or removed:
+            delta['arena_foods_add'] = added
+            delta['arena_foods_del'] = removed
+
+    def _add_items(self, delta, name, added, removed):
+        if not added and not removed:
+            return
+        # An item can appear and be picked up within the same tick
+        delta[name + '_add'] = [(item.position, self._item_key(item)) for item in added if item not in removed]
+        delta[name + '_del'] = [item.position for item in removed if item not in added]
+
+    def _item_key(self, item):
+        if isinstance(item, Food):
+            return self.food_keys[id(item.type)]
+        return item.type.name
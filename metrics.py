@@ -0,0 +1,208 @@
+"""Runtime metrics for fleet monitoring.
+
+GameMetrics is updated from the game loop with a few integer additions per
+tick and frame. Entity and particle counts are not tracked at all; they are
+read from the game only when metrics are collected. MetricsServer serves the
+metrics in the Prometheus text format from a background thread, and
+JsonDumper periodically writes them to a JSON file.
+
+Run a game with metrics:  python snake.py --metrics-port 9100 [--metrics-json metrics.json]
+"""
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FRAME_BUDGET_MS = 1000 / 30  # The game runs at clock.tick(30)
+# Upper bounds of the frame time histogram buckets, in milliseconds
+FRAME_TIME_BUCKETS_MS = (5, 10, 16, 25, 33, 50, 100, 250)
+
+
+class GameMetrics:
+    """Counters collected from one SnakeGame"""
+
+    def __init__(self, game):
+        self.game = game
+        self.ticks = 0
+        self.frames = 0
+        self.dropped_frames = 0  # Frames that took longer than the budget
+        self.frame_time_counts = [0] * (len(FRAME_TIME_BUCKETS_MS) + 1)
+        self.frame_time_sum_ms = 0
+        self.games_played = Counter()  # Mode name -> games started
+        self.score_sums = Counter()  # Mode name -> total of final scores
+        self.game_overs = Counter()  # (mode name, cause) -> games ended
+
+    def record_tick(self):
+        self.ticks += 1
+
+    def record_frame(self, frame_time_ms):
+        self.frames += 1
+        self.frame_time_sum_ms += frame_time_ms
+        self.frame_time_counts[bisect_left(FRAME_TIME_BUCKETS_MS, frame_time_ms)] += 1
+        if frame_time_ms > FRAME_BUDGET_MS:
+            self.dropped_frames += 1
+
+    def record_game_start(self, mode):
+        self.games_played[mode.name] += 1
+
+    def record_game_over(self, mode, score, cause):
+        self.score_sums[mode.name] += score
+        self.game_overs[mode.name, cause] += 1
+
+    def collect(self):
+        """Return a snapshot of all metrics as a dict.
+
+        Called from background threads while the game thread keeps adding
+        keys to the counters, so they are copied before being iterated.
+        """
+        game = self.game
+        game_overs = dict(self.game_overs)
+
+        return {
+            'ticks': self.ticks,
+            'frames': self.frames,
+            'dropped_frames': self.dropped_frames,
+            'frame_time_ms': {
+                'buckets': dict(zip([str(bound) for bound in FRAME_TIME_BUCKETS_MS] + ['+Inf'],
+                                    self.frame_time_counts)),
+                'sum': self.frame_time_sum_ms,
+            },
+            'particles': len(game.particles),
+            'quality_level': int(game.quality.level),
+            'entities': {
+                # Only one of these is non-empty, depending on the mode
+                'snake_segments': len(game.snake) + sum(len(snake.body) for snake in game.arena_alive),
+                'foods': len(game.foods),
+                'power_ups': len(game.power_ups),
+                'obstacles': len(game.obstacles),
+                'portals': len(game.portals),
+                'arena_snakes': len(game.arena_alive),
+                'arena_foods': len(game.arena_foods),
+            },
+            'games_played': dict(self.games_played),
+            'score_sums': dict(self.score_sums),
+            'high_scores': {mode.name: score for mode, score in game.high_scores.items()},
+            'game_overs': [{'mode': mode, 'cause': cause, 'count': count}
+                           for (mode, cause), count in game_overs.items()],
+        }
+
+    def prometheus_text(self):
+        """Render the metrics in the Prometheus text exposition format"""
+        metrics = self.collect()
+        lines = []
+
+        def add(name, kind, help, samples):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        add('snake_ticks_total', 'counter', "Game ticks simulated.", [({}, metrics['ticks'])])
+        add('snake_frames_total', 'counter', "Frames drawn.", [({}, metrics['frames'])])
+        add('snake_dropped_frames_total', 'counter', "Frames that took longer than the frame budget.",
+            [({}, metrics['dropped_frames'])])
+
+        buckets = []
+        cumulative = 0
+        for bound, count in metrics['frame_time_ms']['buckets'].items():
+            cumulative += count
+            le = bound if bound == '+Inf' else str(int(bound) / 1000)
+            buckets.append(({'le': le}, cumulative))
+        lines.append("# HELP snake_frame_seconds Time spent drawing and updating each frame.")
+        lines.append("# TYPE snake_frame_seconds histogram")
+        for labels, value in buckets:
+            lines.append(f'snake_frame_seconds_bucket{{le="{labels["le"]}"}} {value}')
+        lines.append(f"snake_frame_seconds_sum {metrics['frame_time_ms']['sum'] / 1000}")
+        lines.append(f"snake_frame_seconds_count {metrics['frames']}")
+
+        add('snake_particles', 'gauge', "Live particles.", [({}, metrics['particles'])])
+        add('snake_quality_level', 'gauge', "Adaptive draw quality level, 0 is full quality.",
+            [({}, metrics['quality_level'])])
+        add('snake_entities', 'gauge', "Live game entities by kind.",
+            [({'kind': kind}, count) for kind, count in metrics['entities'].items()])
+        add('snake_games_played_total', 'counter', "Games started by mode.",
+            [({'mode': mode}, count) for mode, count in metrics['games_played'].items()])
+        add('snake_score_sum_total', 'counter', "Sum of final scores by mode.",
+            [({'mode': mode}, total) for mode, total in metrics['score_sums'].items()])
+        add('snake_high_score', 'gauge', "High score by mode.",
+            [({'mode': mode}, score) for mode, score in metrics['high_scores'].items()])
+        add('snake_game_overs_total', 'counter', "Games ended by mode and cause.",
+            [({'mode': entry['mode'], 'cause': entry['cause']}, entry['count'])
+             for entry in metrics['game_overs']])
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serves GameMetrics at /metrics from a daemon thread"""
+
+    def __init__(self, metrics, host='127.0.0.1', port=9100):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+
+    def start(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep scrapes out of the game's console output
+
+        server = ThreadingHTTPServer((self.host, self.port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class JsonDumper:
+    """Writes GameMetrics to a JSON file every interval seconds.
+
+    Each dump also includes ticks_per_second, averaged since the previous
+    dump of this dumper.
+    """
+
+    def __init__(self, metrics, path, interval=10):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.last_dump = (time.monotonic(), metrics.ticks)  # (time, ticks)
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            # Keep dumping after a failure, e.g. a full disk
+            try:
+                self.dump()
+            except Exception as error:
+                print(f"Failed to dump metrics to {self.path}: {error!r}", file=sys.stderr)
+
+    def dump(self):
+        metrics = self.metrics.collect()
+        now = time.monotonic()
+        last_time, last_ticks = self.last_dump
+        self.last_dump = (now, metrics['ticks'])
+        metrics['ticks_per_second'] = (metrics['ticks'] - last_ticks) / max(now - last_time, 1e-9)
+
+        # Write to a temporary file first so readers never see a partial dump
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as dump_file:
+            json.dump(metrics, dump_file, indent=2)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,175 @@
+"""Board observations for learning agents.
+
+ObservationEncoder keeps feature planes for a game in one preallocated NumPy
+buffer and updates it from the per-tick deltas used by the spectator feed, so
+each step only touches the cells that changed. Observations are returned as
+views into that buffer: they are not copied and are overwritten by the next
+call to observe(). Arena mode is not supported.
+
+Requires numpy (pip install numpy).
+"""
+from collections import deque
+
+import numpy as np
+
+from deltas import DeltaTracker
+from snake import GRID_COUNT, PORTAL_COOLDOWN_TICKS, GameMode, PowerUpType
+
+
+class ObservationEncoder:
+    """Incrementally maintained feature planes and scalar features.
+
+    Planes are indexed [channel, y, x]:
+      body              1 on every snake segment
+      body_order        push stamp of each segment; head_stamp - value is the
+                        segment's distance from the head
+      head              1 on the head
+      food_<key>        one plane per entry of game.food_types
+      power_up_<type>   one plane per PowerUpType
+      obstacle          obstacles, plus the walls when cropping
+      portal_entrance, portal_exit
+      portal_cooldown   remaining cooldown of an inactive portal, 0..1
+
+    Scalars are score, time_left, length, head_stamp and the remaining ticks
+    of each active power-up. With crop_radius set, observe() returns the
+    (2 * crop_radius + 1) square window centered on the head instead of the
+    whole board.
+    """
+
+    def __init__(self, game, crop_radius=None):
+        self.tracker = DeltaTracker(game)
+        self.channels = (['body', 'body_order', 'head'] +
+                         ['food_' + key for key in game.food_types] +
+                         ['power_up_' + power_up_type.name.lower() for power_up_type in PowerUpType] +
+                         ['obstacle', 'portal_entrance', 'portal_exit', 'portal_cooldown'])
+        self.channel = {name: i for i, name in enumerate(self.channels)}
+        self.scalar_names = (['score', 'time_left', 'length', 'head_stamp'] +
+                             ['power_up_' + power_up_type.name.lower() for power_up_type in PowerUpType])
+        # Channel of each item key, for foods (by food_types key) and power-ups
+        # (by PowerUpType name), plus the slice covering all of them
+        self.item_channels = {
+            'foods': {key: self.channel['food_' + key] for key in game.food_types},
+            'power_ups': {power_up_type.name: self.channel['power_up_' + power_up_type.name.lower()]
+                          for power_up_type in PowerUpType},
+        }
+        self.item_slices = {name: slice(min(channels.values()), max(channels.values()) + 1)
+                            for name, channels in self.item_channels.items()}
+        self.power_up_scalar = {power_up_type.name: self.scalar_names.index('power_up_' + power_up_type.name.lower())
+                                for power_up_type in PowerUpType}
+
+        # Pad the board so egocentric crops near the walls are still views
+        self.crop_radius = crop_radius
+        pad = crop_radius or 0
+        size = GRID_COUNT + 2 * pad
+        self.buffer = np.zeros((len(self.channels), size, size), dtype=np.float32)
+        self.buffer[self.channel['obstacle']] = 1  # Everything off the board is a wall
+        self.planes = self.buffer[:, pad:pad + GRID_COUNT, pad:pad + GRID_COUNT]
+        self.planes[self.channel['obstacle']] = 0
+        self.scalars = np.zeros(len(self.scalar_names), dtype=np.float32)
+
+        self.body = deque()  # (cell, stamp) pairs, head first
+        self.stamp = 0
+        self.portal_cells = []
+
+    def observe(self, game):
+        """Bring the buffer up to date with game and return (planes, scalars)"""
+        if game.game_mode == GameMode.ARENA:
+            raise ValueError("Arena mode is not supported by ObservationEncoder")
+        delta = self.tracker.delta(game)
+
+        if 'snake' in delta:
+            self._reset_snake(delta['snake'])
+        elif 'snake_len' in delta:
+            self._move_snake(delta['snake_push'], delta['snake_len'])
+        self._update_items(delta, 'foods')
+        self._update_items(delta, 'power_ups')
+        if 'obstacles' in delta:
+            plane = self.planes[self.channel['obstacle']]
+            plane[:] = 0
+            for x, y in delta['obstacles']:
+                plane[y, x] = 1
+        self._update_portals(game)
+        self._update_scalars(self.tracker.scalars)
+
+        if self.crop_radius is None:
+            return self.planes, self.scalars
+        # The buffer is padded by crop_radius, so the window starting at the
+        # head's board coordinates is centered on the head
+        x, y = self.body[0][0]
+        size = 2 * self.crop_radius + 1
+        return self.buffer[:, y:y + size, x:x + size], self.scalars
+
+    def _reset_snake(self, snake):
+        for name in ('body', 'body_order', 'head'):
+            self.planes[self.channel[name]] = 0
+        self.body.clear()
+        self.stamp = 0
+        self._move_snake(snake, len(snake))
+
+    def _move_snake(self, pushed, length):
+        body = self.planes[self.channel['body']]
+        order = self.planes[self.channel['body_order']]
+        head = self.planes[self.channel['head']]
+
+        # Trim the tail first so a head moving into the freed cell is kept
+        for _ in range(len(self.body) + len(pushed) - length):
+            (x, y), stamp = self.body.pop()
+            body[y, x] -= 1
+            if order[y, x] == stamp:
+                order[y, x] = 0
+
+        if self.body:
+            x, y = self.body[0][0]
+            head[y, x] = 0
+        for cell in reversed(pushed):
+            self.stamp += 1
+            x, y = cell
+            body[y, x] += 1
+            order[y, x] = self.stamp
+            self.body.appendleft((cell, self.stamp))
+        if self.body:
+            x, y = self.body[0][0]
+            head[y, x] = 1
+
+    def _update_items(self, delta, name):
+        """Apply a full list or added/removed entries of foods or power-ups"""
+        channels = self.item_channels[name]
+        planes = self.planes[self.item_slices[name]]
+        if name in delta:
+            planes[:] = 0
+            added = delta[name]
+        elif name + '_add' in delta:
+            for x, y in delta[name + '_del']:
+                planes[:, y, x] = 0
+            added = delta[name + '_add']
+        else:
+            return
+        for (x, y), key in added:
+            self.planes[channels[key], y, x] = 1
+
+    def _update_portals(self, game):
+        entrance = self.planes[self.channel['portal_entrance']]
+        exit = self.planes[self.channel['portal_exit']]
+        cooldown = self.planes[self.channel['portal_cooldown']]
+        for x, y in self.portal_cells:
+            entrance[y, x] = exit[y, x] = cooldown[y, x] = 0
+
+        self.portal_cells = []
+        for portal in game.portals:
+            (ex, ey), (xx, xy) = portal.entrance, portal.exit
+            entrance[ey, ex] = 1
+            exit[xy, xx] = 1
+            if not portal.is_active:
+                remaining = portal.reactivates_at - game.portal_timers.now
+                cooldown[ey, ex] = max(remaining, 0) / PORTAL_COOLDOWN_TICKS
+            self.portal_cells += [portal.entrance, portal.exit]
+
+    def _update_scalars(self, game_scalars):
+        scalars = self.scalars
+        scalars[0] = game_scalars['score']
+        scalars[1] = game_scalars['time_left']
+        scalars[2] = len(self.body)
+        scalars[3] = self.stamp
+        scalars[4:] = 0
+        for name, duration in game_scalars['active_power_ups']:
+            scalars[self.power_up_scalar[name]] = duration
@@ -0,0 +1,129 @@
+"""Render a recorded game to video frames without a display.
+
+Replays are recorded with `python spectator.py host --record REPLAY`. Every
+tick is drawn with the regular SnakeGame drawing code onto an off-screen
+surface as fast as possible. The replay is split at its keyframes into
+segments, and each worker draws and encodes whole segments on its own, so
+both drawing and encoding scale with the number of workers.
+
+PNG output writes OUTPUT/frame_000000.png, ... Raw output writes one file of
+concatenated RGB frames, which ffmpeg can turn into a video:
+
+    ffmpeg -f rawvideo -pix_fmt rgb24 -s 800x800 -r 30 -i OUTPUT game.mp4
+
+Usage: python render_replay.py REPLAY OUTPUT [--format png|raw] [--workers N] [--threads]
+"""
+import os
+
+# Render with the dummy video driver so no window or GPU is needed. This has
+# to happen before pygame is initialised by importing snake.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import pygame
+
+from snake import SnakeGame, WINDOW_SIZE
+from spectator import apply_frame, advance_animations, read_replay, index_replay
+
+FRAME_SIZE = (WINDOW_SIZE, WINDOW_SIZE)
+FRAME_BYTES = WINDOW_SIZE * WINDOW_SIZE * 3  # One raw RGB frame
+
+
+def render_frames(replay_path, offset, start, end):
+    """Yield (seq, surface) for the ticks start <= seq < end of a replay.
+
+    Reading starts at the keyframe at offset, which can be before start.
+    Ticks before start are applied without being drawn, so particles and
+    animations are already under way in the first drawn frame. end may be
+    None to render up to the end of the replay.
+    """
+    game = SnakeGame()
+    game.in_menu = False
+    game.screen = pygame.Surface(FRAME_SIZE, 0, 32)
+
+    for frame in read_replay(replay_path, offset):
+        seq = frame['seq']
+        if end is not None and seq >= end:
+            break
+        apply_frame(game, frame)
+        advance_animations(game)
+        if seq >= start:
+            game.draw()
+            yield seq, game.screen
+
+
+def render_segment(replay_path, output, output_format, segment, first_seq):
+    """Draw and encode one segment of a replay and return its frame count.
+
+    Raw frames are written in place into the output file, which has to be
+    created at its full size beforehand.
+    """
+    offset, start, end = segment
+    count = 0
+    if output_format == 'raw':
+        with open(output, 'r+b') as raw_file:
+            raw_file.seek((start - first_seq) * FRAME_BYTES)
+            for seq, surface in render_frames(replay_path, offset, start, end):
+                raw_file.write(pygame.image.tobytes(surface, 'RGB'))
+                count += 1
+    else:
+        for seq, surface in render_frames(replay_path, offset, start, end):
+            pygame.image.save(surface, os.path.join(output, f"frame_{seq - first_seq:06d}.png"))
+            count += 1
+    return count
+
+
+def split_replay(keyframes, last_seq, count):
+    """Split a replay at its keyframes into about count (offset, start, end)
+    segments.
+
+    Each segment but the first is read from the keyframe before its start,
+    to warm up its animations.
+    """
+    first_seq = keyframes[0][1]
+    length = max(1, (last_seq - first_seq + 1) // count)
+    segments = []
+    read_offset, start = keyframes[0]
+    for i in range(1, len(keyframes)):
+        seq = keyframes[i][1]
+        if seq - start >= length:
+            segments.append((read_offset, start, seq))
+            read_offset, start = keyframes[i - 1][0], seq
+    segments.append((read_offset, start, None))
+    return segments
+
+
+def render(replay_path, output, output_format='png', workers=None, threads=False):
+    """Render replay_path to output and return the number of frames"""
+    executor_class = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    workers = workers or os.cpu_count() or 1
+    keyframes, last_seq = index_replay(replay_path)
+    first_seq = keyframes[0][1]
+    # A few segments per worker, so workers that finish early can take more
+    segments = split_replay(keyframes, last_seq, workers * 4)
+
+    if output_format == 'raw':
+        with open(output, 'wb') as raw_file:
+            raw_file.truncate((last_seq - first_seq + 1) * FRAME_BYTES)
+    else:
+        os.makedirs(output, exist_ok=True)
+
+    with executor_class(max_workers=workers) as executor:
+        render_one = partial(render_segment, replay_path, output, output_format, first_seq=first_seq)
+        return sum(executor.map(render_one, segments))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a recorded Snake game to video frames")
+    parser.add_argument('replay')
+    parser.add_argument('output', help="directory for PNG frames, or file for raw frames")
+    parser.add_argument('--format', dest='output_format', choices=('png', 'raw'), default='png')
+    parser.add_argument('--workers', type=int, help="render workers (default: one per CPU)")
+    parser.add_argument('--threads', action='store_true', help="render on threads instead of processes")
+    args = parser.parse_args()
+
+    count = render(args.replay, args.output, args.output_format, args.workers, args.threads)
+    print(f"Rendered {count} frames")
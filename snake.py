@@ -1,10 +1,15 @@
+import argparse
 import pygame
 import random
 import sys
-from enum import Enum
+from enum import Enum, IntEnum
 import math
+from array import array
+from collections import deque
 from datetime import datetime
 
+from metrics import FRAME_BUDGET_MS, GameMetrics, MetricsServer, JsonDumper
+
 # Initialize Pygame
 pygame.init()
 
@@ -31,11 +36,28 @@ MENU_HIGHLIGHT = (52, 152, 219)  # Light blue highlight
 MENU_SELECTED = (46, 204, 113)   # Green for selected item
 MENU_HOVER = (41, 128, 185)      # Darker blue for hover
 
+# Timings in ticks (30 per second)
+TIME_TRIAL_TICKS = 60 * 30
+TELEPORT_TICKS = 60  # 2 seconds
+PORTAL_COOLDOWN_TICKS = 90  # 3 seconds
+
+# Adaptive quality
+CAPPED_PARTICLES = 100  # Particle limit from Quality.CAPPED_PARTICLES on
+
+# Arena mode
+ARENA_GRID_COUNT = 160  # The arena board is much larger than the normal one
+ARENA_CELL_SIZE = WINDOW_SIZE // ARENA_GRID_COUNT
+ARENA_SNAKES = 200  # Including the player
+ARENA_FOOD_COUNT = 400
+ARENA_COLORS = [FOOD_RED, FOOD_GOLD, FOOD_PURPLE, FOOD_BLUE,
+                (230, 126, 34), (236, 240, 241), (26, 188, 156)]
+
 class GameMode(Enum):
     CLASSIC = "Classic"
     MAZE = "Maze"
     TIME_TRIAL = "Time Trial"
     PORTAL = "Portal"
+    ARENA = "Arena"
 
 class Direction(Enum):
     UP = 1
@@ -43,6 +65,21 @@ class Direction(Enum):
     LEFT = 3
     RIGHT = 4
 
+OPPOSITE_DIRECTION = {
+    Direction.UP: Direction.DOWN,
+    Direction.DOWN: Direction.UP,
+    Direction.LEFT: Direction.RIGHT,
+    Direction.RIGHT: Direction.LEFT,
+}
+
+class Quality(IntEnum):
+    # Each level also keeps the savings of the levels above it
+    FULL = 0
+    NO_SHADOWS = 1
+    NO_SPARKLES = 2  # No food glow, highlights and decorations or portal sparkles
+    CAPPED_PARTICLES = 3
+    PLAIN_RECTS = 4  # draw_rounded_rect draws plain rectangles
+
 class PowerUpType(Enum):
     GHOST = "Ghost Mode"
     SHIELD = "Shield"
@@ -50,6 +87,8 @@ class PowerUpType(Enum):
     SLOW_TIME = "Slow Time"
 
 class FoodType:
+    __slots__ = ('color', 'points', 'probability', 'effect')
+
     def __init__(self, color, points, probability, effect=None):
         self.color = color
         self.points = points
@@ -57,12 +96,16 @@ class FoodType:
         self.effect = effect
 
 class Food:
+    __slots__ = ('position', 'type', 'animation_counter')
+
     def __init__(self, position, food_type):
         self.position = position
         self.type = food_type
         self.animation_counter = random.uniform(0, 2 * math.pi)
 
 class PowerUp:
+    __slots__ = ('position', 'type', 'duration', 'animation_counter')
+
     def __init__(self, position, type):
         self.position = position
         self.type = type
@@ -70,25 +113,188 @@ class PowerUp:
         self.animation_counter = 0
 
 class Portal:
+    __slots__ = ('entrance', 'exit', 'animation_counter', 'is_active', 'teleporting', 'reactivates_at')
+
     def __init__(self, entrance, exit):
         self.entrance = entrance
         self.exit = exit
         self.animation_counter = 0
-        self.cooldown = 0  # Cooldown timer
         self.is_active = True  # Whether portal can be used
         self.teleporting = False  # Whether currently teleporting
-        self.teleport_timer = 0  # Timer for teleportation animation
+        self.reactivates_at = 0  # Portal timer tick when the cooldown ends
+
+class Particle:
+    __slots__ = ('x', 'y', 'dx', 'dy', 'color', 'size', 'life')
+
+    def __init__(self, x, y, dx, dy, color, size, life):
+        self.x = x
+        self.y = y
+        self.dx = dx
+        self.dy = dy
+        self.color = color
+        self.size = size
+        self.life = life
+
+class ArenaSnake:
+    __slots__ = ('number', 'body', 'direction', 'color', 'is_player', 'alive', 'score',
+                 'death_cause', 'next_head', 'eats')
+
+    def __init__(self, number, body, direction, color, is_player=False):
+        self.number = number  # Marks this snake's cells in the arena grid
+        self.body = deque(body)  # Packed cells (y * ARENA_GRID_COUNT + x), head first
+        self.direction = direction
+        self.color = color
+        self.is_player = is_player
+        self.alive = True
+        self.score = 0
+        self.death_cause = None
+        self.next_head = None  # Cell the head moves into this tick
+        self.eats = False  # Whether that cell has food
+
+class QualityController:
+    """Steps the draw quality down when frames run over budget and back up
+    when there is headroom.
+
+    Frame times are smoothed with a moving average, and the average has to
+    stay past a threshold for a number of frames before the level changes.
+    Stepping down happens above down_ratio of the budget, stepping up only
+    below the lower up_ratio and after waiting longer, so the level doesn't
+    flap between two settings.
+    """
+
+    def __init__(self, budget_ms=FRAME_BUDGET_MS, down_ratio=0.9, up_ratio=0.6,
+                 down_frames=15, up_frames=90):
+        self.level = Quality.FULL
+        self.budget_ms = budget_ms
+        self.down_ratio = down_ratio
+        self.up_ratio = up_ratio
+        self.down_frames = down_frames
+        self.up_frames = up_frames
+        self.average_ms = None
+        self.frames_over = 0
+        self.frames_under = 0
+
+    def record_frame(self, frame_time_ms):
+        if self.average_ms is None:
+            self.average_ms = frame_time_ms
+        else:
+            self.average_ms += (frame_time_ms - self.average_ms) * 0.1
+
+        if self.average_ms > self.budget_ms * self.down_ratio:
+            self.frames_over += 1
+            self.frames_under = 0
+        elif self.average_ms < self.budget_ms * self.up_ratio:
+            self.frames_under += 1
+            self.frames_over = 0
+        else:
+            self.frames_over = self.frames_under = 0
+
+        if self.frames_over >= self.down_frames and self.level < Quality.PLAIN_RECTS:
+            self.level = Quality(self.level + 1)
+            self.frames_over = 0
+        elif self.frames_under >= self.up_frames and self.level > Quality.FULL:
+            self.level = Quality(self.level - 1)
+            self.frames_under = 0
+
+class Timer:
+    __slots__ = ('due', 'callback', 'args')
+
+    def __init__(self, due, callback, args):
+        self.due = due
+        self.callback = callback
+        self.args = args
+
+class TimerWheel:
+    """Tick-based hashed timer wheel.
+
+    Timers are filed in the slot for the tick they are due, so advancing only
+    looks at one slot no matter how many timers are pending. Timers further
+    out than the wheel size just stay in their slot for extra laps. Slot
+    lists are only allocated while they hold timers.
+    """
+
+    def __init__(self, size=64):
+        self.slots = [None] * size
+        self.now = 0
+
+    def clear(self):
+        """Drop every pending timer and start again from tick 0"""
+        for index, slot in enumerate(self.slots):
+            if slot is not None:
+                self.slots[index] = None
+        self.now = 0
+
+    def schedule(self, delay, callback, *args):
+        """Call callback(*args) after delay ticks and return its Timer"""
+        timer = Timer(self.now + max(1, delay), callback, args)
+        index = timer.due % len(self.slots)
+        if self.slots[index] is None:
+            self.slots[index] = [timer]
+        else:
+            self.slots[index].append(timer)
+        return timer
+
+    def advance(self):
+        """Move on one tick and fire the timers that are due"""
+        self.now += 1
+        index = self.now % len(self.slots)
+        slot = self.slots[index]
+        if not slot:
+            return
+        # Swap in a new list first so callbacks can schedule into this slot
+        self.slots[index] = [timer for timer in slot if timer.due > self.now] or None
+        for timer in slot:
+            if timer.due == self.now:
+                timer.callback(*timer.args)
+
+class TickChanges:
+    """What happened to the snake, foods and power-ups during one tick.
+
+    Readers such as the spectator feed and the observation encoder apply
+    these instead of comparing the whole board every tick.
+    """
+    __slots__ = ('reset', 'snake_pushed', 'snake_popped', 'foods_added', 'foods_removed',
+                 'power_ups_added', 'power_ups_removed')
+
+    def __init__(self):
+        self.reset = False  # A new game was set up, everything may have changed
+        self.snake_pushed = []  # Cells in the order they were pushed onto the head
+        self.snake_popped = 0
+        self.foods_added = []
+        self.foods_removed = []
+        self.power_ups_added = []
+        self.power_ups_removed = []
+
+    def clear(self):
+        self.reset = False
+        self.snake_pushed.clear()
+        self.snake_popped = 0
+        self.foods_added.clear()
+        self.foods_removed.clear()
+        self.power_ups_added.clear()
+        self.power_ups_removed.clear()
 
 class SnakeGame:
+    # Static board background, drawn once by get_background() and shared
+    # by every game
+    background = None
+    # The display and fonts are also shared, so games that are only
+    # simulated don't each pay for their own
+    screen = None
+    font = None
+    small_font = None
+
     def __init__(self):
-        # Initialize display
-        self.screen = pygame.display.set_mode((WINDOW_SIZE, WINDOW_SIZE))
-        pygame.display.set_caption("Snake Game")
-        
-        # Initialize fonts
-        self.font = pygame.font.Font(None, 48)
-        self.small_font = pygame.font.Font(None, 32)
-        
+        # Initialize display and fonts on first use
+        if SnakeGame.screen is None:
+            SnakeGame.screen = pygame.display.set_mode((WINDOW_SIZE, WINDOW_SIZE))
+            pygame.display.set_caption("Snake Game")
+            SnakeGame.font = pygame.font.Font(None, 48)
+            SnakeGame.small_font = pygame.font.Font(None, 32)
+
+        # Draw quality, adjusted to the frame time by run()
+        self.quality = QualityController()
+
         # Initialize food types
         self.food_types = {
             'normal': FoodType(FOOD_RED, 10, 0.7),
@@ -112,15 +318,33 @@ class SnakeGame:
         
         # Initialize snake and game elements
         self.direction = Direction.RIGHT
-        self.snake = []
+        self.snake = deque()  # Head first, so moving is O(1) at both ends
         self.foods = []
         self.power_ups = []
         self.obstacles = []
         self.portals = []
         self.particles = []
-        self.active_power_ups = {}
+        self.active_power_ups = {}  # Power-up type -> tick it expires at
         self.game_speed = 10
-        self.time_left = 60 * 30
+        # Game timers pause while the snake is teleporting, portal timers don't
+        self.timers = TimerWheel()
+        self.portal_timers = TimerWheel()
+        self.time_trial_ends = TIME_TRIAL_TICKS
+
+        # Arena mode state, see setup_arena()
+        self.arena_grid = []
+        self.arena_foods = {}
+        self.arena_snakes = []
+        self.arena_alive = []
+
+        # Changes recorded during the current tick, and those of the last
+        # completed tick (see update())
+        self.tick = 0
+        self.changes = TickChanges()
+        self.tick_changes = TickChanges()
+
+        # Optional runtime metrics (see metrics.py)
+        self.metrics = None
         
         # Initialize game
         self.reset_game()
@@ -129,14 +353,31 @@ class SnakeGame:
         self.selected_menu_item = 0
         self.menu_hover = -1
 
+        # Optional spectator feed (see spectator.py), published to every tick
+        self.spectator_feed = None
+
     def load_high_scores(self):
         # Initialize with default values
         return {mode: 0 for mode in GameMode}
 
+    @property
+    def time_left(self):
+        """Ticks left in a Time Trial game"""
+        if self.game_mode != GameMode.TIME_TRIAL:
+            return TIME_TRIAL_TICKS
+        return self.time_trial_ends - self.timers.now
+
     def save_high_score(self):
         if self.score > self.high_scores[self.game_mode]:
             self.high_scores[self.game_mode] = self.score
 
+    def end_game(self, cause):
+        """End the current game, recording what ended it"""
+        self.game_over = True
+        self.save_high_score()
+        if self.metrics is not None:
+            self.metrics.record_game_over(self.game_mode, self.score, cause)
+
     def reset_game(self):
         # Store menu state
         current_mode = self.game_mode
@@ -146,7 +387,7 @@ class SnakeGame:
         # Reset game elements
         self.direction = Direction.RIGHT
         center = GRID_COUNT // 2
-        self.snake = [(center - i, center) for i in range(3)]  # Ensure the snake starts in the center
+        self.snake = deque((center - i, center) for i in range(3))  # Ensure the snake starts in the center
         self.foods = []
         self.power_ups = []
         self.obstacles = []
@@ -157,12 +398,28 @@ class SnakeGame:
         self.particles = []
         self.active_power_ups = {}
         self.game_speed = 10
-        self.time_left = 60 * 30
+        self.timers.clear()
+        self.portal_timers.clear()
+        self.time_trial_ends = TIME_TRIAL_TICKS
+        self.arena_grid = []
+        self.arena_foods = {}
+        self.arena_snakes = []
+        self.arena_alive = []
+        self.changes.reset = True
+
+        if self.game_mode == GameMode.TIME_TRIAL:
+            self.timers.schedule(TIME_TRIAL_TICKS, self.end_time_trial)
+
+        if self.metrics is not None and not current_in_menu:
+            self.metrics.record_game_start(self.game_mode)
 
         # Generate portals if the game mode is PORTAL
         if self.game_mode == GameMode.PORTAL:
             self.generate_portals()
 
+        if self.game_mode == GameMode.ARENA:
+            self.setup_arena()
+
         # Restore menu state
         self.game_mode = current_mode
         self.selected_mode = current_selected_mode
@@ -191,7 +448,9 @@ class SnakeGame:
             pos = (random.randint(0, GRID_COUNT-1), random.randint(0, GRID_COUNT-1))
             if pos not in self.snake and pos not in [p.position for p in self.power_ups]:
                 power_up_type = random.choice(list(PowerUpType))
-                self.power_ups.append(PowerUp(pos, power_up_type))
+                power_up = PowerUp(pos, power_up_type)
+                self.power_ups.append(power_up)
+                self.changes.power_ups_added.append(power_up)
 
     def handle_menu_input(self):
         for event in pygame.event.get():
@@ -309,59 +568,65 @@ class SnakeGame:
             self.screen.blit(text_surface, text_rect)
 
     def handle_power_up(self, power_up):
-        if power_up.type == PowerUpType.GHOST:
-            self.active_power_ups[PowerUpType.GHOST] = 300  # 10 seconds
-        elif power_up.type == PowerUpType.SHIELD:
-            self.active_power_ups[PowerUpType.SHIELD] = 300
-        elif power_up.type == PowerUpType.DOUBLE_POINTS:
-            self.active_power_ups[PowerUpType.DOUBLE_POINTS] = 300
-        elif power_up.type == PowerUpType.SLOW_TIME:
-            self.active_power_ups[PowerUpType.SLOW_TIME] = 300
+        self.active_power_ups[power_up.type] = self.timers.now + power_up.duration
+        self.timers.schedule(power_up.duration, self.expire_power_up, power_up.type)
+        if power_up.type == PowerUpType.SLOW_TIME:
             self.game_speed = 5
 
-    def update_power_ups(self):
-        for power_up_type in list(self.active_power_ups.keys()):
-            self.active_power_ups[power_up_type] -= 1
-            if self.active_power_ups[power_up_type] <= 0:
-                del self.active_power_ups[power_up_type]
-                if power_up_type == PowerUpType.SLOW_TIME:
-                    self.game_speed = 10
+    def expire_power_up(self, power_up_type):
+        # Picking the same power-up up again extends it, making this timer stale
+        if self.active_power_ups.get(power_up_type) != self.timers.now:
+            return
+        del self.active_power_ups[power_up_type]
+        if power_up_type == PowerUpType.SLOW_TIME:
+            self.game_speed = 10
+
+    def end_time_trial(self):
+        self.end_game('time')
+
+    def complete_teleport(self, portal):
+        portal.teleporting = False
+        self.snake.appendleft(portal.exit)
+        self.changes.snake_pushed.append(portal.exit)
+        # Create particle effects at both entrance and exit
+        self.create_particles(portal.entrance, PORTAL_COLOR, 20)
+        self.create_particles(portal.exit, PORTAL_COLOR, 20)
+
+    def reactivate_portal(self, portal):
+        portal.is_active = True
 
     def update(self):
+        """Advance the game by one tick and publish it to any spectators"""
+        self.update_state()
+        # Hand this tick's changes to readers and start recording the next tick
+        self.tick += 1
+        self.tick_changes, self.changes = self.changes, self.tick_changes
+        self.changes.clear()
+        if self.metrics is not None:
+            self.metrics.record_tick()
+        if self.spectator_feed is not None:
+            self.spectator_feed.publish(self)
+
+    def update_state(self):
         if self.game_over:
             self.update_particles()
             return
 
+        if self.game_mode == GameMode.ARENA:
+            self.update_arena()
+            return
+
         # Handle portal teleportation and cooldowns
-        for portal in self.portals:
-            if portal.teleporting:
-                portal.teleport_timer -= 1
-                if portal.teleport_timer <= 0:
-                    # Complete teleportation
-                    portal.teleporting = False
-                    head = self.snake[0]
-                    self.snake.insert(0, portal.exit)
-                    # Create particle effects at both entrance and exit
-                    self.create_particles(portal.entrance, PORTAL_COLOR, 20)
-                    self.create_particles(portal.exit, PORTAL_COLOR, 20)
-            
-            if not portal.is_active:
-                portal.cooldown -= 1
-                if portal.cooldown <= 0:
-                    portal.is_active = True
+        self.portal_timers.advance()
 
         # Only continue with normal update if not teleporting
         if not any(portal.teleporting for portal in self.portals):
-            # Update various timers and effects
-            self.update_power_ups()
-            self.generate_power_up()
+            # Fire power-up expiry, the Time Trial end and other timed events
+            self.timers.advance()
+            if self.game_over:
+                return
 
-            if self.game_mode == GameMode.TIME_TRIAL:
-                self.time_left -= 1
-                if self.time_left <= 0:
-                    self.game_over = True
-                    self.save_high_score()
-                    return
+            self.generate_power_up()
 
             # Update food animations
             for food in self.foods:
@@ -383,17 +648,20 @@ class SnakeGame:
             if not self.handle_collision(new_head):
                 return
 
-            self.snake.insert(0, new_head)
+            self.snake.appendleft(new_head)
+            self.changes.snake_pushed.append(new_head)
 
             # Check for power-up collision
-            for power_up in self.power_ups[:]:
+            for power_up in self.power_ups:
                 if new_head == power_up.position:
                     self.handle_power_up(power_up)
                     self.create_particles(new_head, PORTAL_COLOR)
                     self.power_ups.remove(power_up)
+                    self.changes.power_ups_removed.append(power_up)
+                    break
 
             # Check for food collision
-            for food in self.foods[:]:
+            for food in self.foods:
                 if new_head == food.position:
                     points = food.type.points
                     if PowerUpType.DOUBLE_POINTS in self.active_power_ups:
@@ -401,6 +669,7 @@ class SnakeGame:
                     self.score += points
                     self.create_particles(new_head, food.type.color)
                     self.foods.remove(food)
+                    self.changes.foods_removed.append(food)
                     
                     # Apply special effects
                     if food.type.color == FOOD_BLUE:
@@ -411,27 +680,36 @@ class SnakeGame:
                     break
             else:
                 self.snake.pop()
+                self.changes.snake_popped += 1
 
             # Maintain higher food count
             self.generate_foods(15)  # Increased minimum food count from 3 to 15
             self.update_particles()
 
+    def get_background(self):
+        """Return the checkered board background, drawing it on first use"""
+        if SnakeGame.background is None:
+            background = pygame.Surface((WINDOW_SIZE, WINDOW_SIZE))
+            for x in range(GRID_COUNT):
+                for y in range(GRID_COUNT):
+                    # Create alternating pattern
+                    if (x + y) % 2 == 0:
+                        color = (40, 55, 71)  # Slightly lighter than background
+                    else:
+                        color = (35, 47, 61)  # Slightly darker than background
+
+                    pygame.draw.rect(background, color,
+                                   (x*GRID_SIZE, y*GRID_SIZE, GRID_SIZE, GRID_SIZE))
+
+                    # Draw subtle grid lines
+                    pygame.draw.rect(background, (45, 62, 80),  # Very subtle grid lines
+                                   (x*GRID_SIZE, y*GRID_SIZE, GRID_SIZE, GRID_SIZE), 1)
+            SnakeGame.background = background
+        return SnakeGame.background
+
     def draw_game_elements(self):
         # Draw checkered background pattern
-        for x in range(GRID_COUNT):
-            for y in range(GRID_COUNT):
-                # Create alternating pattern
-                if (x + y) % 2 == 0:
-                    color = (40, 55, 71)  # Slightly lighter than background
-                else:
-                    color = (35, 47, 61)  # Slightly darker than background
-                    
-                pygame.draw.rect(self.screen, color,
-                               (x*GRID_SIZE, y*GRID_SIZE, GRID_SIZE, GRID_SIZE))
-                
-                # Draw subtle grid lines
-                pygame.draw.rect(self.screen, (45, 62, 80),  # Very subtle grid lines
-                               (x*GRID_SIZE, y*GRID_SIZE, GRID_SIZE, GRID_SIZE), 1)
+        self.screen.blit(self.get_background(), (0, 0))
 
         # Draw snake (simplified and more visible)
         for i, segment in enumerate(self.snake):
@@ -469,6 +747,7 @@ class SnakeGame:
             self.draw_portals()
 
         # Draw food with enhanced styling
+        quality = self.quality.level
         for food in self.foods:
             x = food.position[0] * GRID_SIZE + GRID_SIZE // 2
             y = food.position[1] * GRID_SIZE + GRID_SIZE // 2
@@ -478,13 +757,15 @@ class SnakeGame:
             pulse = math.sin(food.animation_counter) * 2
             size = base_size + pulse
             
+            # Main food body
+            pygame.draw.circle(self.screen, food.type.color, (x, y), size)
+            if quality >= Quality.NO_SPARKLES:
+                continue
+
             # Glow effect (outer circle)
             glow_color = tuple(min(255, c + 50) for c in food.type.color)
             pygame.draw.circle(self.screen, glow_color, (x, y), size + 4, 2)
             
-            # Main food body
-            pygame.draw.circle(self.screen, food.type.color, (x, y), size)
-            
             # Inner highlight (makes it look more 3D)
             highlight_pos = (x - size/4, y - size/4)
             highlight_size = size/3
@@ -542,6 +823,8 @@ class SnakeGame:
                     pygame.draw.lines(self.screen, (180, 120, 200), False, swirl_points, 2)
             
             # Add subtle shadow
+            if quality >= Quality.NO_SHADOWS:
+                continue
             shadow_surface = pygame.Surface((GRID_SIZE, GRID_SIZE), pygame.SRCALPHA)
             shadow_radius = size + 2
             pygame.draw.circle(shadow_surface, (0, 0, 0, 64), 
@@ -560,9 +843,9 @@ class SnakeGame:
 
         # Draw particles
         for particle in self.particles:
-            pygame.draw.circle(self.screen, particle['color'],
-                             (particle['x'], particle['y']),
-                              particle['size'])
+            pygame.draw.circle(self.screen, particle.color,
+                             (particle.x, particle.y),
+                              particle.size)
 
         # Draw score
         score_text = self.font.render(f"Score: {self.score}", True, WHITE)
@@ -570,7 +853,8 @@ class SnakeGame:
 
         # Draw active power-ups
         y_offset = 50
-        for power_up_type, duration in self.active_power_ups.items():
+        for power_up_type, expires_at in self.active_power_ups.items():
+            duration = expires_at - self.timers.now
             power_up_text = self.small_font.render(
                 f"{power_up_type.value}: {duration//30}s", True, WHITE)
             self.screen.blit(power_up_text, (10, y_offset))
@@ -584,6 +868,10 @@ class SnakeGame:
 
     def draw_rounded_rect(self, surface, color, rect, corner_radius_ratio=0.3):
         """Draw a rectangle with rounded corners"""
+        if self.quality.level >= Quality.PLAIN_RECTS:
+            pygame.draw.rect(surface, color, rect)
+            return
+
         x, y, width, height = rect
         corner_radius = min(width, height) * corner_radius_ratio
         
@@ -608,27 +896,28 @@ class SnakeGame:
 
     def create_particles(self, position, color, count=10):
         """Create particle effects at the given position"""
+        if self.quality.level >= Quality.CAPPED_PARTICLES:
+            count = min(count, CAPPED_PARTICLES - len(self.particles))
         for _ in range(count):
             angle = random.uniform(0, 2 * math.pi)
             speed = random.uniform(2, 5)
-            self.particles.append({
-                'x': position[0] * GRID_SIZE + GRID_SIZE//2,
-                'y': position[1] * GRID_SIZE + GRID_SIZE//2,
-                'dx': math.cos(angle) * speed,
-                'dy': math.sin(angle) * speed,
-                'color': color,
-                'size': random.uniform(2, 4),
-                'life': 30
-            })
+            self.particles.append(Particle(
+                position[0] * GRID_SIZE + GRID_SIZE//2,
+                position[1] * GRID_SIZE + GRID_SIZE//2,
+                math.cos(angle) * speed,
+                math.sin(angle) * speed,
+                color,
+                random.uniform(2, 4),
+                30
+            ))
 
     def update_particles(self):
         """Update particle positions and remove dead particles"""
-        for particle in self.particles[:]:
-            particle['x'] += particle['dx']
-            particle['y'] += particle['dy']
-            particle['life'] -= 1
-            if particle['life'] <= 0:
-                self.particles.remove(particle)
+        for particle in self.particles:
+            particle.x += particle.dx
+            particle.y += particle.dy
+            particle.life -= 1
+        self.particles = [particle for particle in self.particles if particle.life > 0]
 
     def generate_foods(self, target_count):
         """Generate food items until reaching the target count"""
@@ -645,7 +934,9 @@ class SnakeGame:
                     list(self.food_types.values()),
                     weights=[ft.probability for ft in self.food_types.values()]
                 )[0]
-                self.foods.append(Food(pos, food_type))
+                food = Food(pos, food_type)
+                self.foods.append(food)
+                self.changes.foods_added.append(food)
             attempts += 1
 
     def handle_input(self):
@@ -692,7 +983,10 @@ class SnakeGame:
         self.screen.fill(BACKGROUND_COLOR)
         
         # Draw game elements
-        self.draw_game_elements()  # Ensure this is called to draw the snake
+        if self.game_mode == GameMode.ARENA:
+            self.draw_arena()
+        else:
+            self.draw_game_elements()  # Ensure this is called to draw the snake
         
         # Draw game over screen if needed
         if self.game_over:
@@ -725,6 +1019,12 @@ class SnakeGame:
             
             pygame.display.flip()
             clock.tick(30)
+            # Time spent on the frame itself, not waiting for the next one
+            frame_time = clock.get_rawtime()
+            if not self.in_menu:
+                self.quality.record_frame(frame_time)
+            if self.metrics is not None:
+                self.metrics.record_frame(frame_time)
 
     def generate_portals(self):
         """Generate portal pairs on the map"""
@@ -756,29 +1056,27 @@ class SnakeGame:
         # Check if the snake collides with the walls
         if (new_head[0] < 0 or new_head[0] >= GRID_COUNT or
             new_head[1] < 0 or new_head[1] >= GRID_COUNT):
-            self.game_over = True
-            self.save_high_score()
+            self.end_game('wall')
             return False
 
         # Check if the snake collides with itself
         if new_head in self.snake:
-            self.game_over = True
-            self.save_high_score()
+            self.end_game('self')
             return False
 
         # Check if the snake collides with obstacles
         if new_head in self.obstacles:
-            self.game_over = True
-            self.save_high_score()
+            self.end_game('obstacle')
             return False
 
         # Check if the snake enters a portal
         for portal in self.portals:
             if new_head == portal.entrance and portal.is_active:
                 portal.teleporting = True
-                portal.teleport_timer = 60  # 2 seconds at 30 FPS
                 portal.is_active = False  # Deactivate portal
-                portal.cooldown = 90  # 3 seconds cooldown
+                portal.reactivates_at = self.portal_timers.now + PORTAL_COOLDOWN_TICKS
+                self.portal_timers.schedule(TELEPORT_TICKS, self.complete_teleport, portal)
+                self.portal_timers.schedule(PORTAL_COOLDOWN_TICKS, self.reactivate_portal, portal)
                 return False  # Pause snake movement during teleportation
 
         return True
@@ -825,6 +1123,8 @@ class SnakeGame:
                 pygame.draw.circle(self.screen, (255, 255, 255), (center_x, center_y), center_size)
                 
                 # Add particle effects
+                if self.quality.level >= Quality.NO_SPARKLES:
+                    continue
                 if portal.teleporting or (portal.is_active and random.random() < 0.3):
                     angle = random.uniform(0, 2 * math.pi)
                     distance = random.uniform(GRID_SIZE * 0.2, GRID_SIZE * 0.4)
@@ -835,6 +1135,206 @@ class SnakeGame:
                     pygame.draw.circle(self.screen, particle_color, 
                                      (particle_x, particle_y), particle_size)
 
+    def setup_arena(self):
+        """Place the player and the AI snakes on an empty arena board"""
+        self.snake = deque()
+        self.foods = []
+        # One unsigned short per cell: 0 when empty, else the snake's number
+        self.arena_grid = array('H', [0]) * (ARENA_GRID_COUNT * ARENA_GRID_COUNT)
+        self.arena_foods = {}
+        self.arena_snakes = []
+
+        center = ARENA_GRID_COUNT // 2
+        self.add_arena_snake(center * ARENA_GRID_COUNT + center, Direction.RIGHT,
+                             (0, 255, 0), is_player=True)
+        attempts = 0
+        while len(self.arena_snakes) < ARENA_SNAKES and attempts < ARENA_SNAKES * 10:
+            attempts += 1
+            x = random.randint(3, ARENA_GRID_COUNT - 4)
+            y = random.randint(3, ARENA_GRID_COUNT - 4)
+            self.add_arena_snake(y * ARENA_GRID_COUNT + x, random.choice(list(Direction)),
+                                 random.choice(ARENA_COLORS))
+
+        self.arena_alive = list(self.arena_snakes)
+        self.spawn_arena_foods()
+
+    def add_arena_snake(self, head, direction, color, is_player=False):
+        """Add a 3 segment snake trailing behind head, if there is room"""
+        body = [head]
+        for _ in range(2):
+            body.append(self.arena_step(body[-1], OPPOSITE_DIRECTION[direction]))
+        if any(self.arena_grid[cell] for cell in body):
+            return
+
+        snake = ArenaSnake(len(self.arena_snakes) + 1, body, direction, color, is_player)
+        for cell in body:
+            self.arena_grid[cell] = snake.number
+        self.arena_snakes.append(snake)
+
+    def arena_step(self, cell, direction):
+        """Return the arena cell next to cell, or None past the edge"""
+        x = cell % ARENA_GRID_COUNT
+        if direction == Direction.LEFT:
+            return cell - 1 if x > 0 else None
+        if direction == Direction.RIGHT:
+            return cell + 1 if x < ARENA_GRID_COUNT - 1 else None
+        cell += -ARENA_GRID_COUNT if direction == Direction.UP else ARENA_GRID_COUNT
+        return cell if 0 <= cell < len(self.arena_grid) else None
+
+    def spawn_arena_foods(self):
+        """Top the arena back up to ARENA_FOOD_COUNT foods"""
+        missing = ARENA_FOOD_COUNT - len(self.arena_foods)
+        if missing <= 0:
+            return
+        food_types = random.choices(
+            list(self.food_types.values()),
+            weights=[ft.probability for ft in self.food_types.values()],
+            k=missing
+        )
+        for food_type in food_types:
+            cell = random.randrange(len(self.arena_grid))
+            if not self.arena_grid[cell]:
+                self.arena_foods[cell] = food_type
+
+    def steer_arena_snake(self, snake):
+        """Pick a safe move for an AI snake, preferring food and going straight"""
+        best_direction = None
+        best_score = -1
+        for direction in Direction:
+            if direction == OPPOSITE_DIRECTION[snake.direction]:
+                continue
+            cell = self.arena_step(snake.body[0], direction)
+            if cell is None or self.arena_grid[cell]:
+                continue
+            score = random.random()
+            if cell in self.arena_foods:
+                score += 2
+            if direction == snake.direction:
+                score += 0.5
+            if score > best_score:
+                best_direction, best_score = direction, score
+        if best_direction is not None:
+            snake.direction = best_direction
+
+    def update_arena(self):
+        """Move every arena snake at once and resolve their collisions.
+
+        Next head cells are hashed to find head-to-head collisions and bodies
+        are looked up in the shared occupancy grid, so a tick costs O(snakes)
+        plus the length of any snake that dies.
+        """
+        grid = self.arena_grid
+        foods = self.arena_foods
+
+        # Choose every move first, hashing the cells the heads move into
+        heads = {}
+        for snake in self.arena_alive:
+            if snake.is_player:
+                snake.direction = self.direction
+            else:
+                self.steer_arena_snake(snake)
+            snake.next_head = self.arena_step(snake.body[0], snake.direction)
+            snake.eats = snake.next_head in foods
+            if snake.next_head is not None:
+                heads.setdefault(snake.next_head, []).append(snake)
+
+        dead = []
+        for snake in self.arena_alive:
+            cell = snake.next_head
+            # Check if the snake runs into the edge of the arena
+            if cell is None:
+                snake.death_cause = 'wall'
+                dead.append(snake)
+                continue
+
+            # Head-to-head: only a strictly longest snake survives
+            rivals = heads[cell]
+            if len(rivals) > 1:
+                longest = max(len(rival.body) for rival in rivals)
+                if (len(snake.body) < longest or
+                        sum(len(rival.body) == longest for rival in rivals) > 1):
+                    snake.death_cause = 'head_to_head'
+                    dead.append(snake)
+                    continue
+
+            # Head-to-body: a tail only moves out of the way if its snake
+            # moves this tick without growing
+            occupant = grid[cell]
+            if occupant:
+                owner = self.arena_snakes[occupant - 1]
+                if cell != owner.body[-1] or owner.next_head is None or owner.eats:
+                    snake.death_cause = 'self' if owner is snake else 'snake'
+                    dead.append(snake)
+
+        # Remove dead snakes before anyone moves into the cells they free up
+        dead_cells = []
+        for snake in dead:
+            snake.alive = False
+            for cell in snake.body:
+                grid[cell] = 0
+            dead_cells.extend(snake.body)
+        survivors = [snake for snake in self.arena_alive if snake.alive]
+
+        # Move tails out before heads move in, for snakes chasing tails
+        for snake in survivors:
+            if snake.eats:
+                snake.score += foods.pop(snake.next_head).points
+            else:
+                grid[snake.body.pop()] = 0
+        for snake in survivors:
+            snake.body.appendleft(snake.next_head)
+            grid[snake.next_head] = snake.number
+        self.arena_alive = survivors
+
+        # Dead snakes leave a trail of food behind
+        for cell in dead_cells[::2]:
+            if not grid[cell]:
+                foods[cell] = self.food_types['normal']
+        self.spawn_arena_foods()
+
+        player = self.arena_snakes[0]
+        self.score = player.score
+        if not player.alive:
+            self.end_game(player.death_cause)
+        elif len(survivors) == 1:
+            self.end_game('last_snake')
+
+    def draw_arena(self):
+        """Draw the whole arena board scaled down to fit the window"""
+        size = ARENA_CELL_SIZE
+        for cell, food_type in self.arena_foods.items():
+            y, x = divmod(cell, ARENA_GRID_COUNT)
+            pygame.draw.rect(self.screen, food_type.color, (x*size, y*size, size, size))
+
+        for snake in self.arena_alive:
+            for cell in snake.body:
+                y, x = divmod(cell, ARENA_GRID_COUNT)
+                pygame.draw.rect(self.screen, snake.color, (x*size, y*size, size, size))
+            # Make heads stand out
+            y, x = divmod(snake.body[0], ARENA_GRID_COUNT)
+            pygame.draw.rect(self.screen, WHITE, (x*size, y*size, size, size), 1)
+
+        # Draw score and snakes left
+        score_text = self.font.render(f"Score: {self.score}", True, WHITE)
+        self.screen.blit(score_text, (10, 10))
+        alive_text = self.small_font.render(f"Snakes: {len(self.arena_alive)}", True, WHITE)
+        self.screen.blit(alive_text, (WINDOW_SIZE - 160, 10))
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snake game")
+    parser.add_argument('--metrics-port', type=int,
+                        help="serve Prometheus metrics on this local port")
+    parser.add_argument('--metrics-json', metavar='PATH',
+                        help="periodically dump metrics as JSON to PATH")
+    parser.add_argument('--metrics-interval', type=float, default=10,
+                        help="seconds between JSON dumps (default: 10)")
+    args = parser.parse_args()
+
     game = SnakeGame()
+    if args.metrics_port is not None or args.metrics_json:
+        game.metrics = GameMetrics(game)
+        if args.metrics_port is not None:
+            MetricsServer(game.metrics, port=args.metrics_port).start()
+        if args.metrics_json:
+            JsonDumper(game.metrics, args.metrics_json, args.metrics_interval).start()
     game.run()
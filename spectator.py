@@ -0,0 +1,425 @@
+"""Spectator broadcast server for watching live games.
+
+The game publishes one state delta per tick into a ring buffer. An asyncio
+server running on a background thread fans those frames out to any number
+of viewers, so the game loop pays the same small cost no matter how many
+people are watching. Late joiners get the latest keyframe followed by the
+deltas after it, and viewers that fall behind are dropped instead of ever
+blocking the game.
+
+Frames are newline-delimited JSON. Viewers rebuild the game state from them
+and render it with the regular SnakeGame drawing code.
+
+The same frames can be recorded to a replay file and rendered offline with
+render_replay.py.
+
+Host a game:   python spectator.py host [--port 8765] [--record REPLAY]
+Watch a game:  python spectator.py watch HOST [--port 8765]
+"""
+import argparse
+import asyncio
+import atexit
+import json
+import math
+import queue
+import socket
+import sys
+import threading
+from collections import deque
+
+import pygame
+
+from deltas import DeltaTracker, take_snapshot
+from snake import (SnakeGame, Food, PowerUp, Portal, ArenaSnake, GameMode, Direction, PowerUpType,
+                   PORTAL_COLOR)
+
+DEFAULT_PORT = 8765
+
+
+def encode_frame(frame):
+    """Serialize a frame once so it can be sent to every viewer as is"""
+    return json.dumps(frame, separators=(',', ':'), default=list).encode() + b'\n'
+
+
+def apply_frame(game, frame):
+    """Apply a keyframe or delta received from a SpectatorFeed to game"""
+    if 'mode' in frame:
+        game.game_mode = GameMode[frame['mode']]
+    if 'score' in frame:
+        game.score = frame['score']
+    if 'time_left' in frame:
+        game.time_trial_ends = game.timers.now + frame['time_left']
+    if 'game_over' in frame:
+        game.game_over = frame['game_over']
+    if 'obstacles' in frame:
+        game.obstacles = [tuple(position) for position in frame['obstacles']]
+
+    if 'snake' in frame:
+        game.snake = deque(tuple(segment) for segment in frame['snake'])
+    if 'snake_push' in frame:
+        for segment in reversed(frame['snake_push']):
+            game.snake.appendleft(tuple(segment))
+        while len(game.snake) > frame['snake_len']:
+            game.snake.pop()
+
+    if 'foods' in frame:
+        game.foods = [Food(tuple(position), game.food_types[key]) for position, key in frame['foods']]
+    if 'foods_del' in frame:
+        eaten = {tuple(position) for position in frame['foods_del']}
+        for food in game.foods:
+            # Food also disappears when a new game starts; only burst on eating
+            if food.position in eaten and game.snake and food.position == game.snake[0]:
+                game.create_particles(food.position, food.type.color)
+        game.foods = [food for food in game.foods if food.position not in eaten]
+        game.foods.extend(Food(tuple(position), game.food_types[key])
+                          for position, key in frame['foods_add'])
+
+    if 'power_ups' in frame:
+        game.power_ups = [PowerUp(tuple(position), PowerUpType[name])
+                          for position, name in frame['power_ups']]
+    if 'power_ups_del' in frame:
+        collected = {tuple(position) for position in frame['power_ups_del']}
+        for power_up in game.power_ups:
+            if power_up.position in collected and game.snake and power_up.position == game.snake[0]:
+                game.create_particles(power_up.position, PORTAL_COLOR)
+        game.power_ups = [power_up for power_up in game.power_ups if power_up.position not in collected]
+        game.power_ups.extend(PowerUp(tuple(position), PowerUpType[name])
+                              for position, name in frame['power_ups_add'])
+
+    if 'portals' in frame:
+        portals = []
+        for i, (entrance, exit, is_active, teleporting) in enumerate(frame['portals']):
+            # Reuse existing portals so their animation carries on smoothly
+            portal = game.portals[i] if i < len(game.portals) else Portal(None, None)
+            portal.entrance = tuple(entrance)
+            portal.exit = tuple(exit)
+            portal.is_active = is_active
+            portal.teleporting = teleporting
+            portals.append(portal)
+        game.portals = portals
+
+    if 'active_power_ups' in frame:
+        game.active_power_ups = {PowerUpType[name]: game.timers.now + duration
+                                 for name, duration in frame['active_power_ups']}
+
+    if 'arena_snakes' in frame:
+        # Viewers only draw arena snakes, so their direction doesn't matter
+        game.arena_alive = [ArenaSnake(number, body, Direction.RIGHT, tuple(color))
+                            for number, color, body in frame['arena_snakes']]
+        game.arena_snakes = list(game.arena_alive)
+    if 'arena_moves' in frame:
+        snakes = {snake.number: snake for snake in game.arena_alive}
+        for number, head, length in frame['arena_moves']:
+            body = snakes[number].body
+            body.appendleft(head)
+            while len(body) > length:
+                body.pop()
+        dead = set(frame['arena_dead'])
+        game.arena_alive = [snake for snake in game.arena_alive if snake.number not in dead]
+
+    if 'arena_foods' in frame:
+        game.arena_foods = {cell: game.food_types[key] for cell, key in frame['arena_foods']}
+    if 'arena_foods_del' in frame:
+        for cell in frame['arena_foods_del']:
+            del game.arena_foods[cell]
+        game.arena_foods.update((cell, game.food_types[key]) for cell, key in frame['arena_foods_add'])
+
+
+def advance_animations(game):
+    """Step the purely visual state of a spectated game by one tick"""
+    for food in game.foods:
+        food.animation_counter = (food.animation_counter + 0.1) % (2 * math.pi)
+    game.update_portals()
+    game.update_particles()
+
+
+class SpectatorFeed:
+    """Publishes per-tick deltas of a game into a fixed-size ring buffer.
+
+    publish() is called from the game loop and never waits on viewers; the
+    ring slot for a sequence number is simply overwritten once the buffer
+    wraps around, so readers that fall that far behind have to be dropped.
+    """
+
+    def __init__(self, capacity=256, keyframe_interval=30):
+        if capacity <= keyframe_interval:
+            raise ValueError("capacity must be larger than keyframe_interval")
+        self.capacity = capacity
+        self.keyframe_interval = keyframe_interval
+        self.ring = [None] * capacity  # (seq, payload) slots
+        self.seq = 0  # Sequence number of the last published frame
+        self.keyframe = None  # (seq, payload) of the latest full state
+        self.tracker = None
+        self.listeners = []  # Called after every publish
+
+    def publish(self, game):
+        """Record the current state of game as the next frame"""
+        if self.tracker is None:
+            self.tracker = DeltaTracker(game)
+        delta = self.tracker.delta(game)
+
+        seq = self.seq + 1
+        delta['seq'] = seq
+        self.ring[seq % self.capacity] = (seq, encode_frame(delta))
+        if self.keyframe is None or seq - self.keyframe[0] >= self.keyframe_interval:
+            keyframe = dict(take_snapshot(game, self.tracker.food_keys), seq=seq, keyframe=True)
+            self.keyframe = (seq, encode_frame(keyframe))
+        # Only bump the sequence number once the slot is written, so readers
+        # on other threads never see a number whose frame is missing
+        self.seq = seq
+
+        for listener in self.listeners:
+            listener()
+
+    def read(self, seq):
+        """Return the payload for seq, or None if it is not published yet.
+
+        Raises LookupError if the frame has already been overwritten.
+        """
+        if seq > self.seq:
+            return None
+        slot = self.ring[seq % self.capacity]
+        if slot is None or slot[0] != seq:
+            raise LookupError(seq)
+        return slot[1]
+
+
+class ReplayRecorder:
+    """Appends every frame of a SpectatorFeed to a replay file.
+
+    Runs on the game thread as a feed listener, so it can never fall behind.
+    Each periodic keyframe of the feed is written right after the delta for
+    the same tick, so a replay can also be read starting from any keyframe.
+    """
+
+    def __init__(self, feed, path):
+        self.feed = feed
+        self.file = open(path, 'wb')
+        self.cursor = None
+        feed.listeners.append(self.record)
+
+    def record(self):
+        if self.cursor is None:
+            seq, payload = self.feed.keyframe
+            self.file.write(payload)
+            self.cursor = seq + 1
+        while self.cursor <= self.feed.seq:
+            self.file.write(self.feed.read(self.cursor))
+            if self.feed.keyframe[0] == self.cursor:
+                self.file.write(self.feed.keyframe[1])
+            self.cursor += 1
+
+    def close(self):
+        self.file.close()
+
+
+def read_replay(path, offset=0):
+    """Yield the frames of a replay file written by ReplayRecorder.
+
+    Reading starts at the keyframe at byte offset. Later keyframes only
+    repeat the state of the delta before them and are skipped.
+    """
+    with open(path, 'rb') as replay:
+        replay.seek(offset)
+        for i, line in enumerate(replay):
+            frame = json.loads(line)
+            if i == 0 or not frame.get('keyframe'):
+                yield frame
+
+
+def index_replay(path):
+    """Return the (offset, seq) of every keyframe in a replay file and the
+    seq of its last frame"""
+    keyframes = []
+    offset = 0
+    seq = None
+    with open(path, 'rb') as replay:
+        for line in replay:
+            frame = json.loads(line)
+            seq = frame['seq']
+            if frame.get('keyframe'):
+                keyframes.append((offset, seq))
+            offset += len(line)
+    return keyframes, seq
+
+
+class Viewer:
+    def __init__(self, writer):
+        self.writer = writer
+        self.cursor = None  # Next seq to send, None until a keyframe is sent
+
+
+class SpectatorServer:
+    """Fans a SpectatorFeed out to TCP viewers from a background thread"""
+
+    def __init__(self, feed, host='0.0.0.0', port=DEFAULT_PORT, send_buffer=16384,
+                 high_water=4096, max_buffer=65536):
+        self.feed = feed
+        self.host = host
+        self.port = port
+        self.send_buffer = send_buffer  # Kernel send buffer size for each viewer socket
+        self.high_water = high_water  # Bytes queued for a viewer before sending pauses
+        self.max_buffer = max_buffer  # Bytes queued for a viewer before it is dropped
+        self.viewers = set()
+        self.loop = None
+        self.wakeup = None
+
+    def start(self):
+        """Start serving on a daemon thread and return once listening.
+
+        The port is bound here, so errors such as the port being in use are
+        raised to the caller.
+        """
+        sock = socket.create_server((self.host, self.port))
+        ready = threading.Event()
+        thread = threading.Thread(target=self._run, args=(sock, ready), daemon=True)
+        thread.start()
+        ready.wait()
+
+    def _run(self, sock, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.wakeup = asyncio.Event()
+        self.loop.run_until_complete(
+            asyncio.start_server(self._handle_viewer, sock=sock))
+        self.loop.create_task(self._broadcast())
+        self.feed.listeners.append(self._notify)
+        ready.set()
+        self.loop.run_forever()
+
+    def _notify(self):
+        # Runs on the game thread: just schedule a wakeup on the server loop
+        self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def _handle_viewer(self, reader, writer):
+        # Keep the kernel from absorbing minutes of frames for a viewer that
+        # doesn't read, so it falls behind the ring and gets dropped instead
+        writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        viewer = Viewer(writer)
+        self.viewers.add(viewer)
+        self._send_pending(viewer)
+        try:
+            # Viewers never send anything; discard whatever arrives until
+            # they disconnect instead of buffering it
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self._drop(viewer)
+
+    async def _broadcast(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            for viewer in list(self.viewers):
+                self._send_pending(viewer)
+
+    def _send_pending(self, viewer):
+        """Queue the frames the viewer has not seen yet, without waiting.
+
+        Sending pauses once the viewer's write buffer passes high_water and
+        carries on at the next wakeup. A viewer that stays paused until the
+        ring wraps past its cursor is dropped.
+        """
+        if viewer.cursor is None:
+            keyframe = self.feed.keyframe
+            if keyframe is None:
+                return
+            viewer.writer.write(keyframe[1])
+            viewer.cursor = keyframe[0] + 1
+
+        transport = viewer.writer.transport
+        while True:
+            try:
+                payload = self.feed.read(viewer.cursor)
+            except LookupError:
+                # The ring wrapped past this viewer
+                self._drop(viewer)
+                return
+            if payload is None or transport.get_write_buffer_size() > self.high_water:
+                break
+            viewer.writer.write(payload)
+            viewer.cursor += 1
+
+        if transport.get_write_buffer_size() > self.max_buffer:
+            self._drop(viewer)
+
+    def _drop(self, viewer):
+        if viewer in self.viewers:
+            self.viewers.discard(viewer)
+            viewer.writer.transport.abort()
+
+
+def _receive_frames(host, port, frames):
+    """Read frames from a spectator server into a queue, ending with None"""
+    try:
+        with socket.create_connection((host, port)) as sock:
+            for line in sock.makefile('rb'):
+                frames.put(json.loads(line))
+    except OSError:
+        pass
+    frames.put(None)
+
+
+def host(port, record=None):
+    """Play a game while broadcasting it to spectators"""
+    game = SnakeGame()
+    feed = SpectatorFeed()
+    SpectatorServer(feed, port=port).start()
+    if record:
+        recorder = ReplayRecorder(feed, record)
+        atexit.register(recorder.close)
+    game.spectator_feed = feed
+    game.run()
+
+
+def watch(host, port):
+    """Render a game broadcast by a spectator server"""
+    game = SnakeGame()
+    game.in_menu = False
+    pygame.display.set_caption("Snake Game - Spectating")
+
+    frames = queue.Queue()
+    threading.Thread(target=_receive_frames, args=(host, port, frames), daemon=True).start()
+
+    clock = pygame.time.Clock()
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                pygame.quit()
+                sys.exit()
+
+        while True:
+            try:
+                frame = frames.get_nowait()
+            except queue.Empty:
+                break
+            if frame is None:
+                print("Disconnected from spectator server")
+                pygame.quit()
+                sys.exit()
+            apply_frame(game, frame)
+            advance_animations(game)
+
+        game.draw()
+        pygame.display.flip()
+        clock.tick(30)
+        game.quality.record_frame(clock.get_rawtime())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Broadcast or watch live Snake games")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    host_parser = subparsers.add_parser('host', help="play a game and broadcast it")
+    host_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    host_parser.add_argument('--record', metavar='REPLAY', help="also save the game to a replay file")
+    watch_parser = subparsers.add_parser('watch', help="watch a broadcast game")
+    watch_parser.add_argument('host')
+    watch_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    if args.command == 'host':
+        host(args.port, args.record)
+    else:
+        watch(args.host, args.port)
@@ -0,0 +1,90 @@
+"""Scenario checks for the Arena collision rules in SnakeGame.update_arena()"""
+import os
+from array import array
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pytest
+
+from snake import SnakeGame, ArenaSnake, GameMode, Direction, ARENA_GRID_COUNT, WHITE
+
+
+def cell(x, y):
+    return y * ARENA_GRID_COUNT + x
+
+
+@pytest.fixture
+def game():
+    """An empty arena with only the player, far from everything else"""
+    game = SnakeGame()
+    game.in_menu = False
+    game.game_mode = GameMode.ARENA
+    game.arena_grid = array('H', [0]) * (ARENA_GRID_COUNT * ARENA_GRID_COUNT)
+    game.arena_foods = {}
+    game.arena_snakes = []
+    game.arena_alive = []
+    # Keep AI snakes going straight and the food where the test puts it
+    game.steer_arena_snake = lambda snake: None
+    game.spawn_arena_foods = lambda: None
+    game.direction = Direction.RIGHT
+    place(game, [cell(100, 100), cell(99, 100), cell(98, 100)], Direction.RIGHT, is_player=True)
+    return game
+
+
+def place(game, body, direction, is_player=False):
+    snake = ArenaSnake(len(game.arena_snakes) + 1, body, direction, WHITE, is_player)
+    for segment in body:
+        game.arena_grid[segment] = snake.number
+    game.arena_snakes.append(snake)
+    game.arena_alive.append(snake)
+    return snake
+
+
+def test_head_to_head_longest_survives(game):
+    longer = place(game, [cell(10, 10), cell(9, 10), cell(8, 10), cell(7, 10)], Direction.RIGHT)
+    shorter = place(game, [cell(12, 10), cell(13, 10), cell(14, 10)], Direction.LEFT)
+    game.update_arena()
+    assert longer.alive and list(longer.body)[0] == cell(11, 10)
+    assert not shorter.alive and shorter.death_cause == 'head_to_head'
+    # The loser's cells are freed rather than left in the grid
+    assert game.arena_grid[cell(14, 10)] == 0
+
+
+def test_head_to_head_equal_lengths_both_die(game):
+    first = place(game, [cell(10, 10), cell(9, 10), cell(8, 10)], Direction.RIGHT)
+    second = place(game, [cell(12, 10), cell(13, 10), cell(14, 10)], Direction.LEFT)
+    game.update_arena()
+    assert not first.alive and first.death_cause == 'head_to_head'
+    assert not second.alive and second.death_cause == 'head_to_head'
+
+
+def test_moving_into_a_tail_that_moves_away(game):
+    leader = place(game, [cell(12, 10), cell(11, 10), cell(10, 10)], Direction.RIGHT)
+    chaser = place(game, [cell(10, 11), cell(10, 12), cell(10, 13)], Direction.UP)
+    game.update_arena()
+    assert leader.alive and chaser.alive
+    assert game.arena_grid[cell(10, 10)] == chaser.number
+
+
+def test_moving_into_a_tail_that_grows_dies(game):
+    leader = place(game, [cell(12, 10), cell(11, 10), cell(10, 10)], Direction.RIGHT)
+    chaser = place(game, [cell(10, 11), cell(10, 12), cell(10, 13)], Direction.UP)
+    game.arena_foods[cell(13, 10)] = game.food_types['normal']
+    game.update_arena()
+    assert leader.alive and len(leader.body) == 4
+    assert not chaser.alive and chaser.death_cause == 'snake'
+
+
+def test_chasing_own_tail(game):
+    snake = place(game, [cell(10, 10), cell(10, 11), cell(11, 11), cell(11, 10)], Direction.RIGHT)
+    game.update_arena()
+    assert snake.alive
+    assert list(snake.body) == [cell(11, 10), cell(10, 10), cell(10, 11), cell(11, 11)]
+
+
+def test_swapping_heads_kills_both(game):
+    first = place(game, [cell(10, 10), cell(9, 10), cell(8, 10)], Direction.RIGHT)
+    second = place(game, [cell(11, 10), cell(12, 10), cell(13, 10)], Direction.LEFT)
+    game.update_arena()
+    assert not first.alive and first.death_cause == 'snake'
+    assert not second.alive and second.death_cause == 'snake'
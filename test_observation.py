@@ -0,0 +1,132 @@
+"""Checks that ObservationEncoder's incremental planes match the game"""
+import os
+import random
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from observation import ObservationEncoder
+from snake import SnakeGame, GameMode, Direction, OPPOSITE_DIRECTION, GRID_COUNT
+
+STEPS = {
+    Direction.UP: (0, -1),
+    Direction.DOWN: (0, 1),
+    Direction.LEFT: (-1, 0),
+    Direction.RIGHT: (1, 0),
+}
+
+
+def steer(game):
+    """Head for an active portal, or else the first food, avoiding crashes"""
+    targets = [portal.entrance for portal in game.portals if portal.is_active]
+    target = targets[0] if targets else game.foods[0].position
+    head = game.snake[0]
+    best = None
+    for direction, (dx, dy) in STEPS.items():
+        if direction == OPPOSITE_DIRECTION[game.direction]:
+            continue
+        x, y = head[0] + dx, head[1] + dy
+        if not (0 <= x < GRID_COUNT and 0 <= y < GRID_COUNT) or (x, y) in game.snake or (x, y) in game.obstacles:
+            continue
+        distance = abs(target[0] - x) + abs(target[1] - y) + random.random()
+        if best is None or distance < best[0]:
+            best = (distance, direction)
+    if best is not None:
+        game.direction = best[1]
+
+
+def rebuild(encoder, game):
+    """Build the feature planes from scratch from the game's own state"""
+    planes = np.zeros_like(encoder.planes)
+    channel = encoder.channel
+    head_stamp = encoder.scalars[encoder.scalar_names.index('head_stamp')]
+    # From the tail up, so the segment nearest the head wins a shared cell
+    for distance, (x, y) in reversed(list(enumerate(game.snake))):
+        planes[channel['body'], y, x] += 1
+        planes[channel['body_order'], y, x] = head_stamp - distance
+    x, y = game.snake[0]
+    planes[channel['head'], y, x] = 1
+    food_keys = {id(food_type): key for key, food_type in game.food_types.items()}
+    for food in game.foods:
+        x, y = food.position
+        planes[channel['food_' + food_keys[id(food.type)]], y, x] = 1
+    for power_up in game.power_ups:
+        x, y = power_up.position
+        planes[channel['power_up_' + power_up.type.name.lower()], y, x] = 1
+    for x, y in game.obstacles:
+        planes[channel['obstacle'], y, x] = 1
+    return planes
+
+
+def compared_channels(encoder):
+    return [encoder.channel[name] for name in encoder.channels if not name.startswith('portal_')]
+
+
+@pytest.mark.parametrize('mode', [GameMode.CLASSIC, GameMode.MAZE, GameMode.PORTAL])
+def test_planes_match_a_full_rebuild(mode):
+    random.seed(mode.value)
+    game = SnakeGame()
+    game.in_menu = False
+    game.game_mode = mode
+    game.reset_game()
+    encoder = ObservationEncoder(game)
+    channels = compared_channels(encoder)
+
+    teleports = resets = 0
+    complete_teleport = game.complete_teleport
+
+    def count_teleport(portal):
+        nonlocal teleports
+        teleports += 1
+        complete_teleport(portal)
+    game.complete_teleport = count_teleport
+
+    for tick in range(3000):
+        if game.game_over or tick % 700 == 699:
+            game.reset_game()
+            resets += 1
+        steer(game)
+        game.update()
+        if not game.snake:
+            continue
+        planes, scalars = encoder.observe(game)
+        assert np.array_equal(planes[channels], rebuild(encoder, game)[channels]), f"tick {tick}"
+        assert scalars[encoder.scalar_names.index('length')] == len(game.snake)
+
+    assert resets
+    if mode == GameMode.PORTAL:
+        assert teleports
+
+
+def test_crop_is_centred_on_the_head():
+    random.seed(3)
+    game = SnakeGame()
+    game.in_menu = False
+    game.reset_game()
+    radius = 5
+    encoder = ObservationEncoder(game, crop_radius=radius)
+    full = ObservationEncoder(game)
+
+    for tick in range(500):
+        if game.game_over:
+            game.reset_game()
+        steer(game)
+        game.update()
+        window, _ = encoder.observe(game)
+        planes, _ = full.observe(game)
+        assert window.shape[1:] == (2 * radius + 1, 2 * radius + 1)
+        assert window[encoder.channel['head'], radius, radius] == 1
+
+        # Cells inside the board match the uncropped planes
+        hx, hy = game.snake[0]
+        for wy in range(2 * radius + 1):
+            y = hy - radius + wy
+            for wx in range(2 * radius + 1):
+                x = hx - radius + wx
+                if 0 <= x < GRID_COUNT and 0 <= y < GRID_COUNT:
+                    assert np.array_equal(window[:, wy, wx], planes[:, y, x])
+                else:
+                    assert window[encoder.channel['obstacle'], wy, wx] == 1